@@ -0,0 +1,112 @@
+import logging
+import threading
+from queue import Queue
+
+from telegram import Update
+from telegram.ext import CallbackContext, Dispatcher
+
+logger = logging.getLogger()
+
+
+# Ключ распределения апдейта: один и тот же и для шардов (процессов), и для полос внутри процесса
+def update_key(update):
+    if isinstance(update, Update):
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+    return 0
+
+
+class Lane:
+    def __init__(self, index):
+        self.index = index
+        self.queue = Queue()
+        self.thread = None
+        self.processed = 0
+        self.max_depth = 0  # максимум с момента последнего отчёта
+        self.peak_depth = 0  # максимум за всё время работы
+
+
+class LaneScheduler:
+    # Апдейты одного пользователя всегда попадают в одну и ту же полосу и обрабатываются по порядку,
+    # апдейты разных пользователей обрабатываются параллельно в разных полосах.
+    # Один пул полос может обслуживать несколько диспетчеров (ботов).
+    # shards — число шардов в многопроцессном режиме: воркер получает только ключи с одним остатком
+    # key % shards, поэтому полосу выбираем по key // shards, иначе при общем делителе часть полос простаивает.
+
+    def __init__(self, workers, shards=1):
+        self.lanes = [Lane(i) for i in range(max(1, workers))]
+        self.shards = max(1, shards)
+
+    def start(self):
+        for lane in self.lanes:
+            lane.thread = threading.Thread(target=self._run, args=(lane,), name=f"lane_{lane.index}", daemon=True)
+            lane.thread.start()
+        logger.info(f"Запущено {len(self.lanes)} полос обработки апдейтов")
+
+    def stop(self):
+        for lane in self.lanes:
+            lane.queue.put(None)
+        for lane in self.lanes:
+            if lane.thread:
+                lane.thread.join()
+        logger.info("Полосы обработки апдейтов остановлены")
+
+    def lane_for(self, update):
+        return self.lanes[(update_key(update) // self.shards) % len(self.lanes)]
+
+    def submit(self, update, process_update):
+        lane = self.lane_for(update)
+        lane.queue.put((process_update, update))
+        depth = lane.queue.qsize()
+        if depth > lane.max_depth:
+            lane.max_depth = depth
+            lane.peak_depth = max(lane.peak_depth, depth)
+
+    def _run(self, lane):
+        while True:
+            item = lane.queue.get()
+            if item is None:
+                break
+            process_update, update = item
+            try:
+                process_update(update)
+            except Exception:
+                logger.exception(f"Необработанная ошибка в полосе {lane.index}")
+            lane.processed += 1
+
+    def stats(self):
+        return [
+            {
+                "lane": lane.index,
+                "depth": lane.queue.qsize(),
+                "max_depth": lane.max_depth,
+                "peak_depth": lane.peak_depth,
+                "processed": lane.processed,
+            }
+            for lane in self.lanes
+        ]
+
+    # Колбэк для job_queue: периодически пишет глубину очередей в лог
+    def log_stats(self, context: CallbackContext):
+        stats = self.stats()
+        for lane in self.lanes:
+            lane.max_depth = 0
+        summary = ", ".join(
+            f"#{s['lane']}: {s['depth']} (max {s['max_depth']}, peak {s['peak_depth']}, done {s['processed']})"
+            for s in stats
+        )
+        logger.info(f"Очереди полос: {summary}")
+
+
+class LaneDispatcher(Dispatcher):
+    # Диспетчер, который не обрабатывает апдейт в своём потоке, а отдаёт его в общий пул полос.
+    # Сама обработка (поиск обработчиков, ConversationHandler и т.д.) — обычный Dispatcher.process_update.
+
+    def __init__(self, *args, lanes, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lanes = lanes
+
+    def process_update(self, update):
+        self.lanes.submit(update, super().process_update)
@@ -0,0 +1,147 @@
+import json
+import logging
+import threading
+import time
+
+from telegram import Update
+from telegram.ext import CallbackContext, DispatcherHandlerStop
+
+logger = logging.getLogger()
+
+# Общий лимит, который списывается с каждого апдейта пользователя
+DEFAULT_ACTION = "default"
+
+WAIT_TEXT = "⏳ Подождите немного и попробуйте снова."
+
+
+class TokenBucket:
+    def __init__(self, burst, per_minute, now):
+        self.capacity = float(burst)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = now
+        self.notified = False
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def has_token(self, now):
+        self.refill(now)
+        return self.tokens >= 1
+
+    def take(self):
+        self.tokens -= 1
+        self.notified = False
+
+    def is_idle(self, now):
+        self.refill(now)
+        return self.tokens >= self.capacity
+
+
+def valid_limit_value(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0
+
+
+def load_limits(defaults, env_value):
+    # FLOOD_LIMITS='{"view_events": {"burst": 3, "per_minute": 6}}' переопределяет значения по умолчанию
+    limits = {action: dict(limit) for action, limit in defaults.items()}
+    if not env_value:
+        return limits
+
+    try:
+        overrides = json.loads(env_value)
+    except ValueError as e:
+        logger.error(f"Не удалось разобрать FLOOD_LIMITS: {e}. Используются лимиты по умолчанию.")
+        return limits
+
+    if not isinstance(overrides, dict):
+        logger.error("FLOOD_LIMITS должен быть JSON-объектом. Используются лимиты по умолчанию.")
+        return limits
+
+    for action, limit in overrides.items():
+        if not isinstance(limit, dict):
+            logger.error(f"FLOOD_LIMITS: лимит '{action}' должен быть объектом, пропускаем")
+            continue
+        merged = dict(limits.get(action, {}), **limit)
+        if not all(valid_limit_value(merged.get(key)) for key in ("burst", "per_minute")):
+            logger.error(f"FLOOD_LIMITS: для '{action}' нужны положительные burst и per_minute, пропускаем")
+            continue
+        limits[action] = merged
+    return limits
+
+
+class FloodControl:
+    # Чистим полностью восстановившиеся корзины, когда их становится слишком много
+    PRUNE_THRESHOLD = 10000
+
+    # classify(update, context) — название «дорогого» действия или None;
+    # scope(update, context) — чьи это квоты (по умолчанию user_id);
+    # on_throttled(update, context, action) — необязательный хук для метрик
+    def __init__(self, limits, classify, scope=None, on_throttled=None):
+        self.limits = limits
+        self.classify = classify
+        self.scope = scope or (lambda update, context: update.effective_user.id)
+        self.on_throttled = on_throttled
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def _bucket(self, scope, action, now):
+        key = (scope, action)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            limit = self.limits[action]
+            bucket = self.buckets[key] = TokenBucket(limit["burst"], limit["per_minute"], now)
+        return bucket
+
+    def _prune(self, now):
+        idle = [key for key, bucket in self.buckets.items() if bucket.is_idle(now)]
+        for key in idle:
+            del self.buckets[key]
+        logger.debug(f"Flood control: удалено {len(idle)} неактивных корзин, осталось {len(self.buckets)}")
+
+    def check(self, scope, action):
+        # Возвращает (разрешено, нужно ли предупредить пользователя)
+        actions = [DEFAULT_ACTION]
+        if action and action != DEFAULT_ACTION and action in self.limits:
+            actions.insert(0, action)
+
+        now = time.monotonic()
+        with self.lock:
+            if len(self.buckets) > self.PRUNE_THRESHOLD:
+                self._prune(now)
+
+            # Сначала проверяем все корзины и только потом списываем: отказ по общему лимиту
+            # не должен съедать токен «дорогого» действия
+            buckets = [self._bucket(scope, name, now) for name in actions]
+            for bucket in buckets:
+                if not bucket.has_token(now):
+                    notify = not bucket.notified
+                    bucket.notified = True
+                    return False, notify
+            for bucket in buckets:
+                bucket.take()
+        return True, False
+
+    # Middleware для группы -1: срабатывает до всех остальных обработчиков
+    def __call__(self, update: Update, context: CallbackContext):
+        user = update.effective_user
+        if user is None:
+            return
+
+        action = self.classify(update, context)
+        allowed, notify = self.check(self.scope(update, context), action)
+        if allowed:
+            return
+
+        logger.warning(f"Flood control: пользователь {user.id} превысил лимит '{action or DEFAULT_ACTION}'")
+        if self.on_throttled:
+            self.on_throttled(update, context, action)
+
+        if update.callback_query:
+            # На callback нужно ответить в любом случае, иначе у пользователя будет висеть «часики»
+            update.callback_query.answer(WAIT_TEXT if notify else None)
+        elif notify and update.effective_message:
+            update.effective_message.reply_text(WAIT_TEXT)
+
+        raise DispatcherHandlerStop()
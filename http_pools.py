@@ -0,0 +1,121 @@
+import datetime
+import logging
+import socket
+import sys
+import threading
+
+import gspread
+import requests
+from google.auth.transport.requests import AuthorizedSession, Request as GoogleAuthRequest
+from gspread.utils import convert_credentials
+from requests.adapters import HTTPAdapter
+from telegram.utils.request import Request
+from urllib3.connection import HTTPConnection
+
+logger = logging.getLogger()
+
+
+def keepalive_socket_options(keepalive_idle):
+    options = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    if 'linux' in sys.platform:
+        options += [
+            (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, keepalive_idle),
+            (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, keepalive_idle // 4)),
+            (socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 8),
+        ]
+    return options
+
+
+# Состояние пулов urllib3: сколько соединений занято, создано и сколько запросов прошло
+def pool_stats(pool_manager):
+    stats = []
+    pools = pool_manager.pools
+    for key in list(pools.keys()):
+        pool = pools.get(key)
+        if pool is None or pool.pool is None:
+            continue
+        stats.append({
+            "host": pool.host,
+            "in_use": pool.pool.maxsize - pool.pool.qsize(),
+            "size": pool.pool.maxsize,
+            "connections": pool.num_connections,
+            "requests": pool.num_requests,
+        })
+    return stats
+
+
+def format_pool_stats(name, stats):
+    if not stats:
+        return f"{name}: нет открытых пулов"
+    return f"{name}: " + ", ".join(
+        f"{s['host']} {s['in_use']}/{s['size']} занято, {s['connections']} соединений, {s['requests']} запросов"
+        for s in stats
+    )
+
+
+def build_telegram_request(pool_size, connect_timeout, read_timeout, keepalive_idle):
+    request = Request(con_pool_size=pool_size, connect_timeout=connect_timeout, read_timeout=read_timeout)
+    # PTB создаёт пулы лениво, поэтому параметры keep-alive можно подменить до первого запроса
+    request._con_pool.connection_pool_kw['socket_options'] = keepalive_socket_options(keepalive_idle)
+    return request
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    def __init__(self, socket_options, **kwargs):
+        self.socket_options = socket_options
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = self.socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+
+class SheetsSession:
+    # Одна авторизованная сессия с общим пулом соединений для всех запросов к Google Sheets.
+    # Токен сервисного аккаунта обновляется заранее из job_queue, а не в момент запроса пользователя.
+
+    def __init__(self, credentials, pool_size, connect_timeout, read_timeout, keepalive_idle, refresh_margin):
+        self.credentials = convert_credentials(credentials)
+        self.refresh_margin = datetime.timedelta(seconds=refresh_margin)
+        self.refresh_lock = threading.Lock()
+
+        self.adapter = KeepAliveAdapter(
+            keepalive_socket_options(keepalive_idle),
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+        )
+        self.session = AuthorizedSession(self.credentials)
+        self.session.mount("https://", self.adapter)
+
+        token_session = requests.Session()
+        token_session.mount("https://", self.adapter)
+        self.token_request = GoogleAuthRequest(token_session)
+
+        self.client = gspread.authorize(None, session=self.session)
+        self.client.set_timeout((connect_timeout, read_timeout))
+        self.refresh()
+
+    def refresh(self):
+        with self.refresh_lock:
+            self.credentials.refresh(self.token_request)
+        logger.info(f"Токен Google обновлён, действует до {self.credentials.expiry}")
+
+    def needs_refresh(self):
+        expiry = self.credentials.expiry
+        if not self.credentials.token or expiry is None:
+            return True
+        # google-auth хранит expiry как naive UTC
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return expiry - now < self.refresh_margin
+
+    # Колбэк для job_queue
+    def refresh_if_needed(self, context):
+        if not self.needs_refresh():
+            return
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"Не удалось заранее обновить токен Google: {e}")
+
+    def pool_stats(self):
+        return pool_stats(self.adapter.poolmanager)
@@ -1,7 +1,12 @@
 import os
+import io
 import logging
 import json
-import gspread
+import functools
+import multiprocessing
+import threading
+from queue import Queue
+import pytz
 from oauth2client.service_account import ServiceAccountCredentials
 from telegram import (
     Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup,
@@ -9,29 +14,95 @@ from telegram import (
 )
 from telegram.ext import (
     Updater, CommandHandler, MessageHandler, Filters,
-    ConversationHandler, CallbackContext, CallbackQueryHandler
+    ConversationHandler, CallbackContext, CallbackQueryHandler, TypeHandler, JobQueue
 )
 
+from dispatch_lanes import LaneDispatcher, LaneScheduler
+from flood_control import FloodControl, load_limits
+from http_pools import SheetsSession, build_telegram_request, format_pool_stats, pool_stats
+from profiler import HandlerProfiler
+from reminders import event_from_row
+from sharding import SharedStore, ShardDispatcher, StoredDict, consume_shard, stop_shards
+from tenants import Tenant, load_tenants
+
 # Логирование
 logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.DEBUG)
 logger = logging.getLogger()
 
-# Загрузка переменных окружения
-TOKEN = os.getenv("TOKEN")
-ADMIN_ID = int(os.getenv("ADMIN_ID"))
-METHODIST_CHAT_ID = int(os.getenv("METHODIST_CHAT_ID"))
-CAMP_CHAT_ID = int(os.getenv("CAMP_CHAT_ID"))
-
-if not TOKEN or not ADMIN_ID:
-    logger.error("Token or Admin ID is not set. Exiting...")
-    exit(1)
-
-# Словари
-user_waiting_state = {}
-user_id_by_username = {}
-approved_users = set()  # Список одобренных user_id
-approved_users = {ADMIN_ID}
-pending_applications = {}
+# Загрузка переменных окружения.
+# Если задан TENANTS_CONFIG (JSON-файл со списком смен), TOKEN/ADMIN_ID/чаты берутся из него,
+# и все смены обслуживаются одним процессом.
+TENANTS_CONFIG = os.getenv("TENANTS_CONFIG")
+TENANT_METRICS_INTERVAL = int(os.getenv("TENANT_METRICS_INTERVAL", "300"))
+
+# Количество параллельных полос обработки апдейтов и период отчёта об их очередях (сек)
+DISPATCH_WORKERS = int(os.getenv("DISPATCH_WORKERS", "4"))
+LANE_STATS_INTERVAL = int(os.getenv("LANE_STATS_INTERVAL", "300"))
+
+# Пулы соединений: размер, таймауты (сек) и keep-alive для Telegram и Google Sheets
+TELEGRAM_CONNECT_TIMEOUT = float(os.getenv("TELEGRAM_CONNECT_TIMEOUT", "5"))
+TELEGRAM_READ_TIMEOUT = float(os.getenv("TELEGRAM_READ_TIMEOUT", "10"))
+SHEETS_POOL_SIZE = int(os.getenv("SHEETS_POOL_SIZE", str(DISPATCH_WORKERS + 2)))
+SHEETS_CONNECT_TIMEOUT = float(os.getenv("SHEETS_CONNECT_TIMEOUT", "5"))
+SHEETS_READ_TIMEOUT = float(os.getenv("SHEETS_READ_TIMEOUT", "30"))
+HTTP_KEEPALIVE_IDLE = int(os.getenv("HTTP_KEEPALIVE_IDLE", "60"))
+# За сколько секунд до истечения заранее обновлять токен Google
+GOOGLE_TOKEN_REFRESH_MARGIN = int(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN", "600"))
+POOL_STATS_INTERVAL = int(os.getenv("POOL_STATS_INTERVAL", "300"))
+
+# Профилирование обработчиков по команде /profile <секунды>
+PROFILE_DEFAULT_SECONDS = 30
+PROFILE_MAX_SECONDS = 600
+
+# Напоминания о мероприятиях: за сколько минут до начала, часовой пояс дат в таблице
+# и периоды (сек) проверки очереди, дочитывания новых строк и полной сверки листов
+REMINDER_OFFSETS = [int(m) for m in os.getenv("REMINDER_OFFSETS", "1440,60").split(",") if m.strip()]
+REMINDER_TIMEZONE = pytz.timezone(os.getenv("REMINDER_TIMEZONE", "Europe/Moscow"))
+REMINDER_TICK_INTERVAL = int(os.getenv("REMINDER_TICK_INTERVAL", "60"))
+REMINDER_SYNC_INTERVAL = int(os.getenv("REMINDER_SYNC_INTERVAL", "120"))
+REMINDER_RESYNC_INTERVAL = int(os.getenv("REMINDER_RESYNC_INTERVAL", "1800"))
+
+# Многопроцессный режим: фронт получает апдейты и раздаёт их SHARD_WORKERS воркерам по user_id.
+# Общее состояние (участники, заявки, кэш мероприятий) хранится в SQLite по пути SHARED_STATE_PATH.
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "0"))
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH") or ("bot_state.sqlite3" if SHARD_WORKERS else None)
+
+# Вебхук вместо polling, если задан WEBHOOK_URL. В режиме нескольких смен каждой нужен свой порт
+# (webhook_port в конфиге, иначе WEBHOOK_PORT + номер смены).
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+
+# Общее между процессами состояние
+shared_store = None
+if SHARED_STATE_PATH:
+    shared_store = SharedStore(SHARED_STATE_PATH)
+
+# Смены: состояние пользователей (участники, заявки, режим рассылки) у каждой своё
+if TENANTS_CONFIG:
+    tenants = load_tenants(TENANTS_CONFIG, shared_store)
+else:
+    TOKEN = os.getenv("TOKEN")
+    ADMIN_ID = int(os.getenv("ADMIN_ID") or 0)
+
+    if not TOKEN or not ADMIN_ID:
+        logger.error("Token or Admin ID is not set. Exiting...")
+        exit(1)
+
+    tenants = [Tenant(
+        name="default",
+        token=TOKEN,
+        admin_id=ADMIN_ID,
+        methodist_chat_id=int(os.getenv("METHODIST_CHAT_ID")),
+        camp_chat_id=int(os.getenv("CAMP_CHAT_ID")),
+        shared_store=shared_store,
+    )]
+tenants_by_token = {tenant.token: tenant for tenant in tenants}
+
+def get_tenant(context: CallbackContext) -> Tenant:
+    return tenants_by_token[context.bot.token]
+
+# Один пул соединений Telegram на все боты: по соединению на long polling каждого бота плюс полосы и задачи
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", str(max(DISPATCH_WORKERS + 4, 8) + len(tenants))))
 
 # Подключение к Google Sheets
 scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
@@ -39,8 +110,20 @@ creds_json = os.environ['GOOGLE_CREDS_JSON']
 print("GOOGLE_CREDS_JSON sample:", creds_json[:200])  # чтобы не засветить весь ключ
 creds_dict = json.loads(creds_json)
 creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-client = gspread.authorize(creds)
-sheet = client.open("Магистр: Регистрация")
+sheets_session = SheetsSession(
+    creds,
+    pool_size=SHEETS_POOL_SIZE,
+    connect_timeout=SHEETS_CONNECT_TIMEOUT,
+    read_timeout=SHEETS_READ_TIMEOUT,
+    keepalive_idle=HTTP_KEEPALIVE_IDLE,
+    refresh_margin=GOOGLE_TOKEN_REFRESH_MARGIN,
+)
+client = sheets_session.client
+
+EVENT_SHEET_NAMES = ["Мероприятия официальные", "Мероприятия неофициальные"]
+
+for tenant in tenants:
+    tenant.connect(client, EVENT_SHEET_NAMES, REMINDER_OFFSETS, REMINDER_TIMEZONE)
 
 # Состояния анкеты
 ASK_FULL_NAME, ASK_BIRTHDAY, ASK_PHONE, ASK_GENDER, ASK_ROLE = range(5)
@@ -49,6 +132,39 @@ WAITING_TEXT = 100
 #Состояние для организации мероприятий
 CHOOSE_EVENT_TYPE, ASK_EVENT_NAME, ASK_EVENT_DATE, ASK_EVENT_PLACE, ASK_EVENT_DESCRIPTION, ASK_EVENT_EXTRA_INFO, ASK_EVENT_CONFIRMATION, SHOW_EVENT_DETAIL = range(8)
 
+# Лимиты flood control: burst — сколько действий подряд, per_minute — скорость восстановления.
+# Переопределяются переменной окружения FLOOD_LIMITS (JSON с теми же ключами).
+DEFAULT_FLOOD_LIMITS = {
+    "default": {"burst": 20, "per_minute": 60},
+    "view_events": {"burst": 3, "per_minute": 6},
+    "create_event": {"burst": 2, "per_minute": 3},
+    "broadcast": {"burst": 3, "per_minute": 5},
+}
+FLOOD_LIMITS = load_limits(DEFAULT_FLOOD_LIMITS, os.getenv("FLOOD_LIMITS"))
+
+# Определяем, к какому «дорогому» действию относится апдейт
+def classify_flood_action(update: Update, context: CallbackContext):
+    if update.callback_query:
+        data = update.callback_query.data or ""
+        if data.startswith("view_"):
+            return "view_events"
+        if data == "confirm_yes":
+            return "create_event"
+    elif update.message:
+        # Кнопка «📋 Узнать мероприятия» только показывает меню, таблицу читает callback view_*
+        if get_tenant(context).user_waiting_state.get(update.message.from_user.id) in ["writing_to_methodists", "writing_to_camp"]:
+            return "broadcast"
+    return None
+
+# Один flood control на все смены, но квоты у каждой смены свои
+def flood_scope(update: Update, context: CallbackContext):
+    return get_tenant(context).name, update.effective_user.id
+
+def count_throttled(update: Update, context: CallbackContext, action):
+    get_tenant(context).count("throttled")
+
+flood_control = FloodControl(FLOOD_LIMITS, classify_flood_action, scope=flood_scope, on_throttled=count_throttled)
+
 def handle_organize_event(update: Update, context: CallbackContext):
     # Проверяем, что это сообщение (а не callback query)
     if update.message:
@@ -89,6 +205,7 @@ def cancel_to_menu(update: Update, context: CallbackContext):
 # --- ХЕЛПЕР ДЛЯ СОХРАНЕНИЯ ТЕКУЩЕГО СОСТОЯНИЯ ---
 def set_current_state(state):
     def wrapper(func):
+        @functools.wraps(func)
         def wrapped(update, context):
             context.user_data["current_state"] = state
             return func(update, context)
@@ -174,17 +291,19 @@ def ask_event_confirmation(update: Update, context: CallbackContext):
     return ASK_EVENT_CONFIRMATION
 
 def confirm_event(update: Update, context: CallbackContext):
-    global sheet  
+    tenant = get_tenant(context)
     query = update.callback_query
     query.answer()
     choice = query.data
 
     username = query.from_user.username or "без username"
     context.user_data["organizer_username"] = username
+    if query.from_user.username:
+        tenant.user_id_by_username[query.from_user.username] = query.from_user.id
 
     if choice == "confirm_yes":
         sheet_name = "Мероприятия официальные" if context.user_data.get("event_type") == "official" else "Мероприятия неофициальные"
-        worksheet = sheet.worksheet(sheet_name)
+        worksheet = tenant.sheet.worksheet(sheet_name)
 
         new_row = [
             context.user_data.get("event_name"),
@@ -194,7 +313,13 @@ def confirm_event(update: Update, context: CallbackContext):
             context.user_data.get("event_extra_info", ""),
             context.user_data.get("organizer_username")
         ]
-        worksheet.append_row(new_row, table_range="A2")
+        organizer_id_column = tenant.reminders.organizer_id_column(sheet_name, create=True)
+        if organizer_id_column is not None:
+            new_row += [""] * (organizer_id_column - len(new_row)) + [str(query.from_user.id)]
+        response = worksheet.append_row(new_row, table_range="A2")
+        tenant.count("sheets_writes")
+        tenant.count("events_created")
+        tenant.reminders.note_appended(sheet_name, response, new_row)
 
         query.edit_message_text("✅ Мероприятие успешно зарегистрировано!")
         return ConversationHandler.END
@@ -233,12 +358,13 @@ def save_event_to_sheet(context: CallbackContext):
 
 # Команды и анкета
 def start(update: Update, context: CallbackContext):
+    tenant = get_tenant(context)
     user = update.effective_user
     user_id = user.id
     logger.info("User started the bot.")
 
-    if user_id in approved_users:
-        if user_id == ADMIN_ID:
+    if user_id in tenant.approved_users:
+        if user_id == tenant.admin_id:
             keyboard = ReplyKeyboardMarkup(
                 [
                     ["📅 Организовать мероприятие", "📋 Узнать мероприятия"],
@@ -325,6 +451,7 @@ def ask_role(update: Update, context: CallbackContext):
     return ASK_ROLE
 
 def submit_application(update: Update, context: CallbackContext):
+    tenant = get_tenant(context)
     user_data = context.user_data
 
     if update.callback_query:
@@ -339,9 +466,10 @@ def submit_application(update: Update, context: CallbackContext):
     user_data["user_id"] = user.id
     user_data["username"] = user.username if user.username else "нет username"
     if user.username:
-        user_id_by_username[user.username] = user.id
+        tenant.user_id_by_username[user.username] = user.id
 
-    pending_applications[user.id] = user_data
+    tenant.pending_applications[user.id] = user_data
+    tenant.count("applications")
 
     text = (
         f"📋 Новая заявка:\n"
@@ -359,7 +487,7 @@ def submit_application(update: Update, context: CallbackContext):
     ]]
 
     logger.info(f"Sending new application from {user_data['username']} to admin.")
-    context.bot.send_message(chat_id=ADMIN_ID, text=text, reply_markup=InlineKeyboardMarkup(buttons))
+    context.bot.send_message(chat_id=tenant.admin_id, text=text, reply_markup=InlineKeyboardMarkup(buttons))
 
     if update.callback_query:
         update.callback_query.message.reply_text("Ваша заявка отправлена на рассмотрение.", reply_markup=ReplyKeyboardRemove())
@@ -369,12 +497,13 @@ def submit_application(update: Update, context: CallbackContext):
     return ConversationHandler.END
 
 def handle_approval_rejection(update: Update, context: CallbackContext):
+    tenant = get_tenant(context)
     query = update.callback_query
     query.answer()
 
     action, user_id_str = query.data.split(":")
     user_id = int(user_id_str)
-    user_data = pending_applications.get(user_id)
+    user_data = tenant.pending_applications.get(user_id)
 
     if not user_data:
         logger.warning(f"Данные заявки для user_id {user_id} не найдены.")
@@ -391,9 +520,10 @@ def handle_approval_rejection(update: Update, context: CallbackContext):
 
     if action == "approve":
         sheet_name = "Методисты" if role == "methodist" else "Магистры"
-        worksheet = sheet.worksheet(sheet_name)
+        worksheet = tenant.sheet.worksheet(sheet_name)
         worksheet.append_row([full_name, birthday, phone, gender, f"@{username}"])
-        approved_users.add(user_id)
+        tenant.count("sheets_writes")
+        tenant.approved_users.add(user_id)
 
         # Сообщение + клавиатура
         links = [
@@ -428,8 +558,9 @@ def handle_approval_rejection(update: Update, context: CallbackContext):
     return ConversationHandler.END
 
 def handle_menu_text(update: Update, context: CallbackContext):
+    tenant = get_tenant(context)
     user_id = update.message.from_user.id
-    state = user_waiting_state.get(user_id)
+    state = tenant.user_waiting_state.get(user_id)
     text = update.message.text
     logger.info(f"User {user_id} selected menu option or sent message. Text: {text}. State: {state}")
 
@@ -437,16 +568,16 @@ def handle_menu_text(update: Update, context: CallbackContext):
         return handle_message_for_sending(update, context)
 
     # Расширенные опции для руководителя
-    if user_id == ADMIN_ID:
+    if user_id == tenant.admin_id:
         cancel_markup = InlineKeyboardMarkup([
             [InlineKeyboardButton("❌ Отменить", callback_data="cancel_action")]
         ])
 
         if text == "📢 Написать методистам":
-            user_waiting_state[user_id] = "writing_to_methodists"
+            tenant.user_waiting_state[user_id] = "writing_to_methodists"
             return update.message.reply_text("Введите сообщение для методистов:", reply_markup=cancel_markup)
         elif text == "📢 Написать всему центру":
-            user_waiting_state[user_id] = "writing_to_camp"
+            tenant.user_waiting_state[user_id] = "writing_to_camp"
             return update.message.reply_text("Введите сообщение для всего центра:", reply_markup=cancel_markup)
         elif text == "🛑 Распрощаться с человеком":
             return update.message.reply_text("Эта функция в разработке 👷")
@@ -469,7 +600,7 @@ def help_command(update: Update, context: CallbackContext):
         parse_mode="HTML"
     )
 def show_admin_menu(update: Update, context: CallbackContext):
-    if update.effective_user.id != ADMIN_ID:
+    if update.effective_user.id != get_tenant(context).admin_id:
         logger.warning(f"Unauthorized access attempt by user {update.effective_user.id}")
         return
 
@@ -480,19 +611,19 @@ def show_admin_menu(update: Update, context: CallbackContext):
 def handle_events_menu(update: Update, context: CallbackContext):
     update.callback_query.answer()
     update.callback_query.message.reply_text("Вы выбрали 'Написать методистам'. Введите сообщение.")
-    user_waiting_state[update.effective_user.id] = "writing_to_methodists"
+    get_tenant(context).user_waiting_state[update.effective_user.id] = "writing_to_methodists"
     logger.info(f"User {update.callback_query.from_user.id} selected 'Написать методистам'.")
 
 
 def handle_camp_menu(update: Update, context: CallbackContext):
     update.callback_query.answer()
     update.callback_query.message.reply_text("Вы выбрали 'Написать всему центру'. Введите сообщение.")
-    user_waiting_state[update.effective_user.id] = "writing_to_camp"
+    get_tenant(context).user_waiting_state[update.effective_user.id] = "writing_to_camp"
     logger.info(f"User {update.callback_query.from_user.id} selected 'Написать всему центру'.")
 
 def handle_cancel_action(update: Update, context: CallbackContext):
     user_id = update.callback_query.from_user.id
-    user_waiting_state[user_id] = None  # Сброс состояния ожидания
+    get_tenant(context).user_waiting_state[user_id] = None  # Сброс состояния ожидания
     logger.info(f"User {user_id} cancelled action.")
 
     # Подтверждаем callback запрос
@@ -507,8 +638,9 @@ def handle_cancel_action(update: Update, context: CallbackContext):
     return ConversationHandler.END  # Завершаем текущую беседу
 
 def handle_message_for_sending(update: Update, context: CallbackContext):
+    tenant = get_tenant(context)
     user_id = update.message.from_user.id
-    state = user_waiting_state.get(user_id)
+    state = tenant.user_waiting_state.get(user_id)
     logger.info(f"Обработано сообщение от пользователя {user_id}. Текущее состояние: {state}")
 
     # Логирование всех данных сообщения
@@ -517,10 +649,10 @@ def handle_message_for_sending(update: Update, context: CallbackContext):
 
     # Если пользователь в режиме написания методистам или центру
     if state == "writing_to_methodists":
-        target_chat_id = METHODIST_CHAT_ID
+        target_chat_id = tenant.methodist_chat_id
         logger.info(f"Отправка в методисты. chat_id: {target_chat_id}")
     elif state == "writing_to_camp":
-        target_chat_id = CAMP_CHAT_ID
+        target_chat_id = tenant.camp_chat_id
         logger.info(f"Отправка в лагерь. chat_id: {target_chat_id}")
     else:
         logger.warning(f"Неизвестное состояние для пользователя {user_id}, состояние: {state}")
@@ -595,18 +727,19 @@ def handle_view_events(update: Update, context: CallbackContext):
 
     # Логируем полученные данные callback
     logger.debug("Callback data: %s", query.data)
+    tenant = get_tenant(context)
 
     try:
         # Проверяем, что пришлел запрос на официальные мероприятия
         if query.data == "view_official_events":
             logger.debug("Fetching official events")
-            events = get_events_from_sheet("Мероприятия официальные")
-            send_event_summaries(events, query)
+            events = get_events_from_sheet(tenant, "Мероприятия официальные")
+            send_event_summaries(events, query, context)
         # Если неофициальные
         elif query.data == "view_unofficial_events":
             logger.debug("Fetching unofficial events")
-            events = get_events_from_sheet("Мероприятия неофициальные")
-            send_event_summaries(events, query)
+            events = get_events_from_sheet(tenant, "Мероприятия неофициальные")
+            send_event_summaries(events, query, context)
         else:
             logger.warning("Unknown callback data: %s", query.data)
 
@@ -615,29 +748,23 @@ def handle_view_events(update: Update, context: CallbackContext):
         logger.error("Error occurred in handle_view_events: %s", e)
 
 # Получение мероприятий из Google Sheets с логированием
-def get_events_from_sheet(sheet_name):
+def get_events_from_sheet(tenant, sheet_name):
     try:
         logger.debug("Fetching events from sheet: %s", sheet_name)
 
         # Получаем данные из листа
-        sheet = sheet.worksheet(sheet_name)
+        worksheet = tenant.sheet.worksheet(sheet_name)
         data = worksheet.get_all_values()[1:]  # Пропускаем заголовки
+        tenant.count("sheets_reads")
 
         logger.debug("Fetched %d rows of data from sheet '%s'", len(data), sheet_name)
 
         events = []
         for i, row in enumerate(data):
-            if len(row) < 6:
+            event = event_from_row(row)
+            if event is None:
                 logger.warning("Skipping row %d due to insufficient data", i)
                 continue
-            event = {
-                'name': row[0],
-                'datetime': row[1],
-                'place': row[2],
-                'description': row[3],
-                'extra_info': row[4],
-                'organizer': row[5]
-            }
             events.append(event)
 
         logger.debug("Successfully fetched %d events from sheet '%s'", len(events), sheet_name)
@@ -651,7 +778,7 @@ def get_events_from_sheet(sheet_name):
         return []
 
 # Отправка кратких описаний мероприятий с логированием и обработкой ошибок
-def send_event_summaries(events, query):
+def send_event_summaries(events, query, context: CallbackContext):
     try:
         # Логируем начало обработки
         logger.debug("send_event_summaries called with %d events", len(events) if events else 0)
@@ -683,8 +810,7 @@ def send_event_summaries(events, query):
         logger.debug("All event summaries sent.")
 
         # Сохраняем список мероприятий для кнопок «Подробнее»
-        context = query.message.bot_data
-        context['current_events'] = events
+        context.bot_data['current_events'] = events
         logger.debug("Event list saved for 'Подробнее' button.")
     except Exception as e:
         logger.error("Error in send_event_summaries: %s", e)
@@ -735,17 +861,93 @@ def show_event_detail(update: Update, context: CallbackContext):
         # Логируем ошибку, если что-то пошло не так
         logger.error("Error occurred in show_event_detail: %s", e)
 
+# Профилирование обработчиков (только для руководителя)
+profiler = HandlerProfiler()
+
+def profile_command(update: Update, context: CallbackContext):
+    if update.effective_user.id != get_tenant(context).admin_id:
+        logger.warning(f"Unauthorized /profile attempt by user {update.effective_user.id}")
+        return
+
+    try:
+        seconds = int(context.args[0]) if context.args else PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        update.message.reply_text("Использование: /profile <секунды>")
+        return
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+
+    if not profiler.start(context.dispatcher):
+        update.message.reply_text("Профилирование уже запущено.")
+        return
+
+    context.job_queue.run_once(finish_profile, seconds, context=update.effective_chat.id)
+    update.message.reply_text(f"Профилирование запущено на {seconds} с. Отчёт придёт документом.")
+
+def finish_profile(context: CallbackContext):
+    report = profiler.stop()
+    if report is None:
+        return
+    context.bot.send_document(
+        chat_id=context.job.context,
+        document=io.BytesIO(report.encode("utf-8")),
+        filename="profile.txt",
+        caption="Отчёт профилирования обработчиков"
+    )
+
+# Загрузка пулов соединений в лог
+def log_pool_stats(context: CallbackContext):
+    logger.info(format_pool_stats("Telegram", pool_stats(context.bot.request._con_pool)))
+    logger.info(format_pool_stats("Google Sheets", sheets_session.pool_stats()))
+
+# Метрики по сменам в лог
+def count_update(update: Update, context: CallbackContext):
+    get_tenant(context).count("updates")
+
+def log_tenant_metrics(context: CallbackContext):
+    for tenant in tenants:
+        logger.info(tenant.format_metrics())
+
 # Запуск бота
-def main():
-    updater = Updater(TOKEN, use_context=True)
-    dispatcher = updater.dispatcher
-    bot: Bot = updater.bot
+# make_dispatcher(tenant, bot, job_queue) создаёт диспетчер нужного класса (полосы или шардирование)
+def build_updaters(make_dispatcher):
+    # Один пул соединений Telegram на все боты процесса
+    telegram_request = build_telegram_request(
+        TELEGRAM_POOL_SIZE, TELEGRAM_CONNECT_TIMEOUT, TELEGRAM_READ_TIMEOUT, HTTP_KEEPALIVE_IDLE
+    )
+    updaters = {}
+    for tenant in tenants:
+        job_queue = JobQueue()
+        dispatcher = make_dispatcher(tenant, Bot(tenant.token, request=telegram_request), job_queue)
+        job_queue.set_dispatcher(dispatcher)
+        updaters[tenant.name] = Updater(dispatcher=dispatcher, workers=None)
+    return updaters
+
+def lane_dispatchers(lanes):
+    # Апдейты разных пользователей обрабатываются параллельно, одного пользователя — строго по порядку
+    return lambda tenant, bot, job_queue: LaneDispatcher(bot, Queue(), job_queue=job_queue, lanes=lanes)
+
+def set_commands(bot: Bot):
     bot.set_my_commands([
         ("start", "📝 Подать заявку"),
         ("admin", "👨‍💼 Руководитель"),
         ("help", "ℹ️ Полезная информация")
     ])
 
+def setup_dispatcher(tenant, updater, run_reminders=True):
+    dispatcher = updater.dispatcher
+    if shared_store:
+        # Кэш мероприятий для кнопок «Подробнее» должен быть виден всем процессам
+        dispatcher.bot_data = StoredDict(shared_store, f"{tenant.name}:bot_data")
+
+    # Счётчик апдейтов смены
+    dispatcher.add_handler(TypeHandler(Update, count_update), group=-2)
+
+    # Flood control до всех остальных обработчиков
+    dispatcher.add_handler(TypeHandler(Update, flood_control), group=-1)
+
+    # Профилирование обработчиков
+    dispatcher.add_handler(CommandHandler("profile", profile_command))
+
     # ConversationHandler для подачи заявки (регистрация пользователя)
     registration_handler = ConversationHandler(
         entry_points=[MessageHandler(Filters.regex("^📝 Подать заявку$"), handle_menu)],
@@ -811,8 +1013,112 @@ def main():
     # Медиа и документы
     dispatcher.add_handler(MessageHandler(Filters.photo | Filters.video | Filters.document, handle_message_for_sending))
 
-    updater.start_polling(timeout=30, drop_pending_updates=True)
-    updater.idle()
+    # Напоминания о мероприятиях
+    if run_reminders:
+        tenant.reminders.active = True
+        updater.job_queue.run_repeating(tenant.reminders.resync, interval=REMINDER_RESYNC_INTERVAL, first=0)
+        updater.job_queue.run_repeating(tenant.reminders.sync_new_rows, interval=REMINDER_SYNC_INTERVAL, first=REMINDER_SYNC_INTERVAL)
+        updater.job_queue.run_repeating(tenant.reminders.tick, interval=REMINDER_TICK_INTERVAL, first=REMINDER_TICK_INTERVAL)
+
+# Общие для всех смен задачи: статистика полос и пулов, обновление токена Google, метрики смен
+def setup_shared_jobs(job_queue, lanes):
+    job_queue.run_repeating(lanes.log_stats, interval=LANE_STATS_INTERVAL, first=LANE_STATS_INTERVAL)
+    job_queue.run_repeating(log_pool_stats, interval=POOL_STATS_INTERVAL, first=POOL_STATS_INTERVAL)
+    job_queue.run_repeating(sheets_session.refresh_if_needed, interval=60, first=60)
+    job_queue.run_repeating(log_tenant_metrics, interval=TENANT_METRICS_INTERVAL, first=TENANT_METRICS_INTERVAL)
+
+def start_receiving(tenant, updater, index):
+    if WEBHOOK_URL:
+        updater.start_webhook(
+            listen="0.0.0.0",
+            port=tenant.webhook_port or WEBHOOK_PORT + index,
+            url_path=tenant.token,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{tenant.token}",
+            drop_pending_updates=True
+        )
+    else:
+        updater.start_polling(timeout=30, drop_pending_updates=True)
+
+# Ждём сигнала остановки на первом боте, затем останавливаем остальные
+def idle(updaters):
+    updaters = list(updaters)
+    updaters[0].idle()
+    for updater in updaters[1:]:
+        updater.stop()
+
+# Воркер многопроцессного режима: обрабатывает только апдейты своего шарда (для всех смен).
+# Напоминания отправляет только воркер 0, чтобы они не дублировались.
+def run_shard_worker(index, queue):
+    logger.info(f"Воркер {index} запущен")
+    lanes = LaneScheduler(DISPATCH_WORKERS, shards=SHARD_WORKERS)
+    updaters = build_updaters(lane_dispatchers(lanes))
+    for tenant in tenants:
+        setup_dispatcher(tenant, updaters[tenant.name], run_reminders=(index == 0))
+    setup_shared_jobs(updaters[tenants[0].name].job_queue, lanes)
+    lanes.start()
+
+    dispatchers = {name: updater.dispatcher for name, updater in updaters.items()}
+    for name, updater in updaters.items():
+        updater.job_queue.start()
+        threading.Thread(target=updater.dispatcher.start, name=f"dispatcher_{name}_{index}", daemon=True).start()
+
+    try:
+        consume_shard(queue, dispatchers)
+    except KeyboardInterrupt:
+        pass
+
+    for updater in updaters.values():
+        updater.job_queue.stop()
+        updater.dispatcher.stop()
+    lanes.stop()
+    logger.info(f"Воркер {index} остановлен")
+
+# Фронт многопроцессного режима: получает апдейты всех смен и раскладывает их по воркерам
+def run_sharded():
+    # spawn, а не fork: каждый воркер заново открывает свои соединения с Telegram и Google
+    mp = multiprocessing.get_context("spawn")
+    queues = [mp.Queue() for _ in range(SHARD_WORKERS)]
+    workers = [
+        mp.Process(target=run_shard_worker, args=(i, queue), name=f"shard_{i}")
+        for i, queue in enumerate(queues)
+    ]
+    for worker in workers:
+        worker.start()
+
+    updaters = build_updaters(
+        lambda tenant, bot, job_queue: ShardDispatcher(bot, Queue(), job_queue=job_queue, queues=queues, tenant=tenant.name)
+    )
+    for index, tenant in enumerate(tenants):
+        updater = updaters[tenant.name]
+        set_commands(updater.bot)
+        start_receiving(tenant, updater, index)
+    logger.info(f"Фронт запущен, смен: {len(tenants)}, воркеров: {SHARD_WORKERS}, общее состояние: {SHARED_STATE_PATH}")
+
+    idle(updaters.values())
+
+    stop_shards(queues)
+    for worker in workers:
+        worker.join()
+    for name, updater in updaters.items():
+        logger.info(f"Смена '{name}': распределено апдейтов по воркерам: {updater.dispatcher.routed}")
+
+def main():
+    if SHARD_WORKERS:
+        return run_sharded()
+
+    lanes = LaneScheduler(DISPATCH_WORKERS)
+    updaters = build_updaters(lane_dispatchers(lanes))
+    for tenant in tenants:
+        updater = updaters[tenant.name]
+        set_commands(updater.bot)
+        setup_dispatcher(tenant, updater)
+    setup_shared_jobs(updaters[tenants[0].name].job_queue, lanes)
+    lanes.start()
+
+    for index, tenant in enumerate(tenants):
+        start_receiving(tenant, updaters[tenant.name], index)
+    idle(updaters.values())
+    lanes.stop()
 
 if __name__ == '__main__':
     main()
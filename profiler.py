@@ -0,0 +1,161 @@
+import logging
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from telegram.ext import ConversationHandler
+
+logger = logging.getLogger()
+
+
+def iter_handlers(handlers):
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            yield from iter_handlers(handler.entry_points)
+            for state_handlers in handler.states.values():
+                yield from iter_handlers(state_handlers)
+            yield from iter_handlers(handler.fallbacks)
+        else:
+            yield handler
+
+
+def callback_name(callback):
+    return getattr(callback, "__name__", type(callback).__name__)
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+class HandlerProfiler:
+    # Сэмплирующий профайлер обработчиков диспетчера.
+    # Колбэки подменяются обёртками только на время замера, поэтому в выключенном состоянии накладных расходов нет.
+
+    def __init__(self, interval=0.005, top=15):
+        self.interval = interval
+        self.top = top
+        self.lock = threading.Lock()
+        self.stats_lock = threading.Lock()  # calls и wall_time пишутся из всех потоков-обработчиков
+        self.active = False
+        self.original_callbacks = {}
+        self.current = {}  # thread id -> имя обработчика, который сейчас выполняется
+        self.stop_event = threading.Event()
+        self.sampler = None
+        self._reset()
+
+    def _reset(self):
+        self.samples = Counter()
+        self.self_samples = defaultdict(Counter)
+        self.cumulative_samples = defaultdict(Counter)
+        self.calls = Counter()
+        self.wall_time = Counter()
+        self.started_at = None
+
+    def _wrap(self, callback):
+        name = callback_name(callback)
+        wrapper_code = None
+
+        def profiled(update, context):
+            thread_id = threading.get_ident()
+            previous = self.current.get(thread_id)
+            self.current[thread_id] = (name, wrapper_code)
+            started = time.perf_counter()
+            try:
+                return callback(update, context)
+            finally:
+                elapsed = time.perf_counter() - started
+                with self.stats_lock:
+                    self.calls[name] += 1
+                    self.wall_time[name] += elapsed
+                if previous is None:
+                    self.current.pop(thread_id, None)
+                else:
+                    self.current[thread_id] = previous
+
+        wrapper_code = profiled.__code__
+        return profiled
+
+    def start(self, dispatcher):
+        with self.lock:
+            if self.active:
+                return False
+            self._reset()
+            for group in dispatcher.handlers.values():
+                for handler in iter_handlers(group):
+                    if handler in self.original_callbacks:
+                        continue
+                    self.original_callbacks[handler] = handler.callback
+                    handler.callback = self._wrap(handler.callback)
+
+            self.active = True
+            self.started_at = time.monotonic()
+            self.stop_event.clear()
+            self.sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+            self.sampler.start()
+        logger.info(f"Профилирование включено для {len(self.original_callbacks)} обработчиков")
+        return True
+
+    def stop(self):
+        with self.lock:
+            if not self.active:
+                return None
+            self.stop_event.set()
+            self.sampler.join()
+            for handler, callback in self.original_callbacks.items():
+                handler.callback = callback
+            self.original_callbacks = {}
+            self.current = {}
+            self.active = False
+            duration = time.monotonic() - self.started_at
+        logger.info("Профилирование выключено")
+        return self.report(duration)
+
+    def _sample(self):
+        while not self.stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, (name, wrapper_code) in list(self.current.items()):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+
+                self.samples[name] += 1
+                self.self_samples[name][frame_label(frame)] += 1
+
+                # Поднимаемся по стеку до обёртки обработчика, каждую функцию считаем один раз
+                seen = set()
+                while frame is not None and frame.f_code is not wrapper_code:
+                    label = frame_label(frame)
+                    if label not in seen:
+                        seen.add(label)
+                        self.cumulative_samples[name][label] += 1
+                    frame = frame.f_back
+
+    def report(self, duration):
+        lines = [
+            f"Профиль обработчиков за {duration:.1f} с, интервал сэмплирования {self.interval * 1000:.0f} мс",
+            "",
+        ]
+        with self.stats_lock:
+            calls = Counter(self.calls)
+            wall_time = Counter(self.wall_time)
+        names = sorted(set(calls) | set(self.samples), key=lambda n: (self.samples[n], wall_time[n]), reverse=True)
+        if not names:
+            lines.append("За это время обработчики не вызывались.")
+            return "\n".join(lines)
+
+        for name in names:
+            lines.append(
+                f"=== {name}: {calls[name]} вызовов, {wall_time[name]:.3f} с всего, "
+                f"{self.samples[name]} сэмплов (~{self.samples[name] * self.interval:.2f} с)"
+            )
+            if self.self_samples[name]:
+                lines.append("  Собственное время:")
+                for label, count in self.self_samples[name].most_common(self.top):
+                    lines.append(f"    {count:6d}  {label}")
+                lines.append("  Включая вложенные вызовы:")
+                for label, count in self.cumulative_samples[name].most_common(self.top):
+                    lines.append(f"    {count:6d}  {label}")
+            lines.append("")
+        return "\n".join(lines)
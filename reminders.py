@@ -0,0 +1,257 @@
+import datetime
+import heapq
+import html
+import itertools
+import logging
+import re
+import threading
+
+from gspread.utils import a1_to_rowcol, rowcol_to_a1
+from telegram.ext import CallbackContext
+
+logger = logging.getLogger()
+
+EVENT_FIELDS = ['name', 'datetime', 'place', 'description', 'extra_info', 'organizer']
+# Колонка с user_id организатора ищется по заголовку, а не по позиции: бот сам добавляет её
+# (первая свободная колонка после полей мероприятия) и заполняет при создании мероприятия,
+# чтобы напоминания организатору не зависели от того, что бот помнит в памяти после перезапуска
+ORGANIZER_ID_HEADER = "ID организатора"
+
+# Форматы, в которых организаторы обычно вводят дату и время
+DATETIME_FORMATS = [
+    "%d.%m.%Y %H:%M",
+    "%d.%m.%y %H:%M",
+    "%H:%M %d.%m.%Y",
+    "%H:%M %d.%m.%y",
+]
+DATETIME_FORMATS_NO_YEAR = [
+    "%d.%m %H:%M",
+    "%H:%M %d.%m",
+]
+
+
+def event_from_row(row, organizer_id_column=None):
+    if len(row) < len(EVENT_FIELDS):
+        return None
+    event = dict(zip(EVENT_FIELDS, row))
+    has_id = organizer_id_column is not None and organizer_id_column < len(row)
+    event["organizer_id"] = row[organizer_id_column] if has_id else ""
+    return event
+
+
+def find_organizer_id_column(header):
+    # Номер колонки (с нуля) или None; колонки самих полей мероприятия не подходят
+    for index, title in enumerate(header):
+        if index >= len(EVENT_FIELDS) and title.strip() == ORGANIZER_ID_HEADER:
+            return index
+    return None
+
+
+def column_letter(index):
+    return re.sub(r"\d", "", rowcol_to_a1(1, index + 1))
+
+
+def organizer_id_from_event(event):
+    organizer_id = str(event.get("organizer_id") or "").strip()
+    return int(organizer_id) if organizer_id.isdigit() else None
+
+
+def parse_event_datetime(text, now):
+    # now — текущее время с часовым поясом, в нём же интерпретируется дата мероприятия
+    text = re.sub(r"\s+", " ", re.sub(r"\bв\b|,", " ", text.strip().lower())).strip()
+    text = text.replace("-", ".").replace("/", ".")
+
+    for fmt in DATETIME_FORMATS:
+        try:
+            return now.tzinfo.localize(datetime.datetime.strptime(text, fmt))
+        except ValueError:
+            continue
+
+    for fmt in DATETIME_FORMATS_NO_YEAR:
+        try:
+            parsed = datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        # Без года: берём ближайшую дату, не ушедшую в прошлое больше чем на полгода
+        try:
+            candidate = now.tzinfo.localize(parsed.replace(year=now.year))
+        except ValueError:
+            return None
+        if now - candidate > datetime.timedelta(days=183):
+            candidate = now.tzinfo.localize(parsed.replace(year=now.year + 1))
+        return candidate
+    return None
+
+
+def format_offset(minutes):
+    if minutes % 60 == 0:
+        return f"{minutes // 60} ч"
+    return f"{minutes} мин"
+
+
+class ReminderScheduler:
+    # Один heap на все напоминания: (время отправки, порядковый номер, ключ строки, версия, смещение).
+    # При изменении строки версия увеличивается, и старые записи в heap просто пропускаются при извлечении.
+
+    def __init__(self, sheet, sheet_names, camp_chat_id, offsets, timezone, resolve_organizer):
+        self.sheet = sheet
+        self.sheet_names = sheet_names
+        self.camp_chat_id = camp_chat_id
+        self.offsets = sorted(offsets, reverse=True)
+        self.timezone = timezone
+        self.resolve_organizer = resolve_organizer
+
+        self.lock = threading.Lock()
+        self.heap = []
+        self.counter = itertools.count()
+        self.events = {}  # (лист, номер строки) -> {"row", "event", "starts_at", "version"}
+        self.row_counts = {name: 0 for name in sheet_names}  # сколько строк данных уже прочитано
+        self.organizer_id_columns = {}  # лист -> номер колонки ORGANIZER_ID_HEADER или None
+        self.sent = 0
+        # True только в процессе, где работают задачи напоминаний (в шардированном режиме — воркер 0)
+        self.active = False
+
+    def now(self):
+        return datetime.datetime.now(self.timezone)
+
+    def _schedule_row(self, sheet_name, row_number, row, now):
+        # Вызывается под self.lock. Возвращает True, если строка новая или изменилась.
+        key = (sheet_name, row_number)
+        row = list(row) + [""] * (len(EVENT_FIELDS) - len(row))
+        known = self.events.get(key)
+        if known and known["row"] == row:
+            return False
+
+        version = known["version"] + 1 if known else 0
+        event = event_from_row(row, self.organizer_id_columns.get(sheet_name))
+        starts_at = parse_event_datetime(event["datetime"], now) if event["name"] else None
+        self.events[key] = {"row": row, "event": event, "starts_at": starts_at, "version": version}
+
+        if starts_at is None:
+            if event["name"]:
+                logger.warning(f"Не удалось разобрать дату мероприятия '{event['name']}': {event['datetime']}")
+            return True
+
+        for offset in self.offsets:
+            fire_at = starts_at - datetime.timedelta(minutes=offset)
+            if fire_at > now:
+                heapq.heappush(self.heap, (fire_at, next(self.counter), key, version, offset))
+        return True
+
+    def _drop_rows_from(self, sheet_name, first_row):
+        for key in [key for key in self.events if key[0] == sheet_name and key[1] >= first_row]:
+            del self.events[key]
+
+    # create=True — добавить заголовок колонки, если его ещё нет (вызывается при создании мероприятия)
+    def organizer_id_column(self, sheet_name, create=False):
+        try:
+            if sheet_name not in self.organizer_id_columns or (create and self.organizer_id_columns[sheet_name] is None):
+                worksheet = self.sheet.worksheet(sheet_name)
+                header = worksheet.row_values(1)
+                column = find_organizer_id_column(header)
+                if column is None and create:
+                    column = max(len(header), len(EVENT_FIELDS))
+                    worksheet.update_cell(1, column + 1, ORGANIZER_ID_HEADER)
+                    logger.info(f"В лист '{sheet_name}' добавлена колонка '{ORGANIZER_ID_HEADER}'")
+                self.organizer_id_columns[sheet_name] = column
+        except Exception as e:
+            logger.error(f"Не удалось прочитать заголовки листа '{sheet_name}': {e}")
+        return self.organizer_id_columns.get(sheet_name)
+
+    # Сразу ставим в расписание строку, которую бот только что добавил (ответ append_row)
+    # Если задачи напоминаний работают в другом процессе, heap здесь никто не разбирает — строку подхватит его sync_new_rows
+    def note_appended(self, sheet_name, append_response, row):
+        if not self.active:
+            return
+        try:
+            updated_range = append_response["updates"]["updatedRange"]
+            row_number = a1_to_rowcol(updated_range.split("!")[-1].split(":")[0])[0]
+        except (KeyError, TypeError, IndexError, ValueError) as e:
+            logger.warning(f"Не удалось определить строку нового мероприятия: {e}")
+            return
+
+        with self.lock:
+            # row_counts не трогаем: строки, добавленные выше другими людьми, ещё должен дочитать sync_new_rows
+            self._schedule_row(sheet_name, row_number, row, self.now())
+
+    # Колбэк для job_queue: дочитывает только строки, добавленные после последнего чтения
+    def sync_new_rows(self, context: CallbackContext):
+        now = self.now()
+        for sheet_name in self.sheet_names:
+            start_row = self.row_counts[sheet_name] + 2  # первая строка — заголовки
+            organizer_id_column = self.organizer_id_column(sheet_name)
+            last_column = max(len(EVENT_FIELDS) - 1, organizer_id_column or 0)
+            try:
+                rows = self.sheet.worksheet(sheet_name).get(f"A{start_row}:{column_letter(last_column)}")
+            except Exception as e:
+                logger.error(f"Не удалось прочитать новые строки листа '{sheet_name}': {e}")
+                continue
+            if not rows:
+                continue
+
+            with self.lock:
+                changed = sum(
+                    self._schedule_row(sheet_name, start_row + i, row, now)
+                    for i, row in enumerate(rows)
+                )
+                self.row_counts[sheet_name] = start_row + len(rows) - 2
+            logger.info(f"Напоминания: в листе '{sheet_name}' прочитано {len(rows)} новых строк, изменено {changed}")
+
+    # Колбэк для job_queue: полная сверка листов, чтобы заметить отредактированные и удалённые строки
+    def resync(self, context: CallbackContext):
+        now = self.now()
+        for sheet_name in self.sheet_names:
+            try:
+                values = self.sheet.worksheet(sheet_name).get_all_values()
+            except Exception as e:
+                logger.error(f"Не удалось прочитать лист '{sheet_name}': {e}")
+                continue
+            header, rows = (values[0], values[1:]) if values else ([], [])
+
+            with self.lock:
+                self.organizer_id_columns[sheet_name] = find_organizer_id_column(header)
+                changed = sum(
+                    self._schedule_row(sheet_name, i + 2, row, now)
+                    for i, row in enumerate(rows)
+                )
+                self._drop_rows_from(sheet_name, len(rows) + 2)
+                self.row_counts[sheet_name] = len(rows)
+            if changed:
+                logger.info(f"Напоминания: в листе '{sheet_name}' обновлено {changed} строк")
+
+    def _pop_due(self, now):
+        due = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                fire_at, _, key, version, offset = heapq.heappop(self.heap)
+                known = self.events.get(key)
+                if known is None or known["version"] != version:
+                    continue  # строка изменилась или удалена
+                due.append((known["event"], known["starts_at"], offset))
+        return due
+
+    # Колбэк для job_queue: отправляет все наступившие напоминания пачками, по одному сообщению на чат
+    def tick(self, context: CallbackContext):
+        due = self._pop_due(self.now())
+        if not due:
+            return
+
+        batches = {}
+        for event, starts_at, offset in due:
+            line = (
+                f"<b>{html.escape(event['name'])}</b> — через {format_offset(offset)} "
+                f"({starts_at.strftime('%d.%m %H:%M')})\n📍 {html.escape(event['place'])}"
+            )
+            batches.setdefault(self.camp_chat_id, []).append(line)
+            organizer_id = organizer_id_from_event(event) or self.resolve_organizer(event["organizer"])
+            if organizer_id:
+                batches.setdefault(organizer_id, []).append(line)
+
+        for chat_id, lines in batches.items():
+            text = "⏰ Напоминание о мероприятиях:\n\n" + "\n\n".join(lines)
+            try:
+                context.bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML")
+            except Exception as e:
+                logger.error(f"Не удалось отправить напоминание в чат {chat_id}: {e}")
+        self.sent += len(due)
+        logger.info(f"Отправлено {len(due)} напоминаний в {len(batches)} чатов")
@@ -0,0 +1,144 @@
+import json
+import logging
+import sqlite3
+import threading
+from collections.abc import MutableMapping, MutableSet
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import Dispatcher
+
+from dispatch_lanes import update_key
+
+logger = logging.getLogger()
+
+
+class SharedStore:
+    # Общее для всех процессов хранилище ключ-значение поверх SQLite (WAL, соединение на поток)
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        with self.connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = sqlite3.connect(self.path, timeout=30)
+        return conn
+
+    def get(self, namespace, key):
+        row = self.connection().execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, namespace, key, value):
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (namespace, key, value) VALUES (?, ?, ?)", (namespace, key, value)
+            )
+
+    def delete(self, namespace, key):
+        with self.connection() as conn:
+            return conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key)).rowcount
+
+    def keys(self, namespace):
+        return [row[0] for row in self.connection().execute("SELECT key FROM kv WHERE namespace = ?", (namespace,))]
+
+    def count(self, namespace):
+        return self.connection().execute("SELECT COUNT(*) FROM kv WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+
+# Ключи и значения хранятся в JSON, поэтому int-ключи (user_id) остаются int после чтения
+class StoredDict(MutableMapping):
+    def __init__(self, store, namespace):
+        self.store = store
+        self.namespace = namespace
+
+    def __getitem__(self, key):
+        value = self.store.get(self.namespace, json.dumps(key))
+        if value is None:
+            raise KeyError(key)
+        return json.loads(value)
+
+    def __setitem__(self, key, value):
+        self.store.set(self.namespace, json.dumps(key), json.dumps(value, ensure_ascii=False))
+
+    def __delitem__(self, key):
+        if not self.store.delete(self.namespace, json.dumps(key)):
+            raise KeyError(key)
+
+    def __iter__(self):
+        return (json.loads(key) for key in self.store.keys(self.namespace))
+
+    def __len__(self):
+        return self.store.count(self.namespace)
+
+
+class StoredSet(MutableSet):
+    def __init__(self, store, namespace):
+        self.store = store
+        self.namespace = namespace
+
+    def __contains__(self, item):
+        return self.store.get(self.namespace, json.dumps(item)) is not None
+
+    def __iter__(self):
+        return (json.loads(key) for key in self.store.keys(self.namespace))
+
+    def __len__(self):
+        return self.store.count(self.namespace)
+
+    def add(self, item):
+        self.store.set(self.namespace, json.dumps(item), "1")
+
+    def discard(self, item):
+        self.store.delete(self.namespace, json.dumps(item))
+
+
+def shard_for(update, shards):
+    return update_key(update) % shards
+
+
+class ShardDispatcher(Dispatcher):
+    # Диспетчер фронта: апдейт не обрабатывается, а уходит воркеру по user_id.
+    # tenant — имя смены, чей бот получил апдейт; воркер по нему выбирает диспетчер.
+
+    def __init__(self, *args, queues, tenant, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.queues = queues
+        self.tenant = tenant
+        self.routed = [0] * len(queues)
+
+    def process_update(self, update):
+        if isinstance(update, TelegramError):
+            logger.error(f"Ошибка при получении апдейтов: {update}")
+            return
+        if not isinstance(update, Update):
+            return
+        shard = shard_for(update, len(self.queues))
+        self.queues[shard].put((self.tenant, update.to_json()))
+        self.routed[shard] += 1
+
+
+def stop_shards(queues):
+    for queue in queues:
+        queue.put(None)
+
+
+# Цикл воркера: читает апдейты своего шарда и передаёт их в очередь диспетчера нужной смены
+def consume_shard(queue, dispatchers):
+    while True:
+        item = queue.get()
+        if item is None:
+            break
+        tenant, data = item
+        dispatcher = dispatchers[tenant]
+        dispatcher.update_queue.put(Update.de_json(json.loads(data), dispatcher.bot))
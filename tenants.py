@@ -0,0 +1,93 @@
+import json
+import logging
+import threading
+from collections import Counter
+
+from reminders import ReminderScheduler
+from sharding import StoredDict, StoredSet
+
+logger = logging.getLogger()
+
+DEFAULT_SPREADSHEET = "Магистр: Регистрация"
+
+
+class Tenant:
+    # Одна смена: свой бот, руководитель, чаты, таблица и состояние пользователей.
+    # Пулы потоков, HTTP-сессии и rate limiter общие для всех смен в процессе.
+
+    def __init__(self, name, token, admin_id, methodist_chat_id, camp_chat_id,
+                 spreadsheet=DEFAULT_SPREADSHEET, webhook_port=None, shared_store=None):
+        self.name = name
+        self.token = token
+        self.admin_id = admin_id
+        self.methodist_chat_id = methodist_chat_id
+        self.camp_chat_id = camp_chat_id
+        self.spreadsheet = spreadsheet
+        self.webhook_port = webhook_port
+
+        self.user_waiting_state = {}
+        if shared_store:
+            self.user_id_by_username = StoredDict(shared_store, f"{name}:user_id_by_username")
+            self.approved_users = StoredSet(shared_store, f"{name}:approved_users")
+            self.pending_applications = StoredDict(shared_store, f"{name}:pending_applications")
+        else:
+            self.user_id_by_username = {}
+            self.approved_users = set()
+            self.pending_applications = {}
+        self.approved_users.add(admin_id)
+
+        self.sheet = None
+        self.reminders = None
+        self.metrics = Counter()
+        self.metrics_lock = threading.Lock()
+
+    def connect(self, client, event_sheet_names, offsets, timezone):
+        self.sheet = client.open(self.spreadsheet)
+        self.reminders = ReminderScheduler(
+            self.sheet, event_sheet_names, self.camp_chat_id, offsets, timezone, self.resolve_organizer
+        )
+
+    # Для строк без user_id (например, внесённых в таблицу вручную) ищем организатора по username;
+    # напоминание можно отправить только известному боту пользователю
+    def resolve_organizer(self, username):
+        return self.user_id_by_username.get(username.strip().lstrip("@"))
+
+    # Обработчики одной смены выполняются в нескольких полосах одновременно, поэтому счётчики только под lock
+    def count(self, key, n=1):
+        with self.metrics_lock:
+            self.metrics[key] += n
+
+    def format_metrics(self):
+        reminders_sent = self.reminders.sent if self.reminders else 0
+        with self.metrics_lock:
+            metrics = sorted(self.metrics.items())
+        counters = ", ".join(f"{key}={value}" for key, value in metrics)
+        return f"Смена '{self.name}': {counters or 'нет активности'}, напоминаний={reminders_sent}"
+
+
+def load_tenants(path, shared_store=None):
+    # Формат файла:
+    # {"tenants": [{"name": "camp1", "token": "...", "admin_id": 1, "methodist_chat_id": -100...,
+    #               "camp_chat_id": -100..., "spreadsheet": "Магистр: Регистрация", "webhook_port": 8443}]}
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+
+    tenants = []
+    for entry in config["tenants"]:
+        tenant = Tenant(
+            name=entry["name"],
+            token=entry["token"],
+            admin_id=int(entry["admin_id"]),
+            methodist_chat_id=int(entry["methodist_chat_id"]),
+            camp_chat_id=int(entry["camp_chat_id"]),
+            spreadsheet=entry.get("spreadsheet", DEFAULT_SPREADSHEET),
+            webhook_port=entry.get("webhook_port"),
+            shared_store=shared_store,
+        )
+        tenants.append(tenant)
+
+    names = [tenant.name for tenant in tenants]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Имена смен в {path} должны быть уникальными: {names}")
+    logger.info(f"Загружено смен: {len(tenants)} ({', '.join(names)})")
+    return tenants
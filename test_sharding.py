@@ -0,0 +1,149 @@
+import multiprocessing
+import threading
+from queue import Queue
+
+from telegram import Bot, Update
+
+from dispatch_lanes import LaneScheduler
+from sharding import SharedStore, ShardDispatcher, StoredDict, StoredSet, consume_shard, stop_shards
+
+SHARDS = 3
+TENANT = "camp"
+TOKEN = "123456:ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghi"
+USERS = [101, 102, 103, 104, 105, 106, 107]
+# Число шардов и полос с общим делителем — случай, когда при выборе полосы по user_id % lanes полосы простаивают
+LANE_SHARDS = 4
+LANES = 4
+LANE_USERS = list(range(1000, 1040))
+
+
+# Записанные апдейты: каждый пользователь присылает несколько сообщений, некоторые — /approve
+def recorded_updates(users=USERS, steps=5):
+    updates = []
+    for step in range(steps):
+        for user_id in users:
+            update_id = len(updates) + 1
+            text = "/approve" if (user_id + step) % 4 == 0 else f"{user_id}:{step}"
+            updates.append({
+                "update_id": update_id,
+                "message": {
+                    "message_id": update_id,
+                    "date": 0,
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+                    "text": text,
+                },
+            })
+    return updates
+
+
+# Заглушка диспетчера в процессе воркера: вместо обработчиков пишет состояние пользователя в SharedStore
+class StubQueue:
+    def __init__(self, store, shard):
+        self.shard = shard
+        self.history = StoredDict(store, f"{TENANT}:history")
+        self.shard_by_user = StoredDict(store, f"{TENANT}:shard_by_user")
+        self.approved_users = StoredSet(store, f"{TENANT}:approved_users")
+        self.misrouted = StoredSet(store, f"{TENANT}:misrouted")
+
+    def put(self, update):
+        user_id = update.effective_user.id
+        if self.shard_by_user.setdefault(user_id, self.shard) != self.shard:
+            self.misrouted.add(user_id)
+        self.history[user_id] = self.history.get(user_id, []) + [update.update_id]
+        if update.message.text == "/approve":
+            self.approved_users.add(user_id)
+
+
+class StubDispatcher:
+    def __init__(self, store, shard):
+        self.bot = None
+        self.update_queue = StubQueue(store, shard)
+
+
+def run_stub_shard(shard, queue, path):
+    consume_shard(queue, {TENANT: StubDispatcher(SharedStore(path), shard)})
+
+
+# В воркере апдейты проходят через настоящий LaneScheduler; обработчик записывает, в какой полосе он выполнился
+class LaneQueue:
+    def __init__(self, store, shard, lanes):
+        self.shard = shard
+        self.lanes = lanes
+        self.lane_by_user = StoredDict(store, f"{TENANT}:lane_by_user:{shard}")
+
+    def put(self, update):
+        self.lanes.submit(update, self.record_lane)
+
+    def record_lane(self, update):
+        self.lane_by_user[update.effective_user.id] = threading.current_thread().name
+
+
+class LaneStubDispatcher:
+    def __init__(self, store, shard, lanes):
+        self.bot = None
+        self.update_queue = LaneQueue(store, shard, lanes)
+
+
+def run_lane_shard(shard, queue, path):
+    lanes = LaneScheduler(LANES, shards=LANE_SHARDS)
+    lanes.start()
+    consume_shard(queue, {TENANT: LaneStubDispatcher(SharedStore(path), shard, lanes)})
+    lanes.stop()
+
+
+def start_workers(target, shards, path):
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue() for _ in range(shards)]
+    workers = [context.Process(target=target, args=(i, queue, path)) for i, queue in enumerate(queues)]
+    for worker in workers:
+        worker.start()
+    return queues, workers
+
+
+def replay(queues, workers, updates):
+    bot = Bot(TOKEN)
+    router = ShardDispatcher(bot, Queue(), queues=queues, tenant=TENANT)
+    for data in updates:
+        router.process_update(Update.de_json(data, bot))
+    stop_shards(queues)
+    for worker in workers:
+        worker.join(timeout=30)
+        assert worker.exitcode == 0
+    return router
+
+
+def test_updates_of_one_user_stay_on_one_shard_in_order(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    store = SharedStore(path)
+
+    queues, workers = start_workers(run_stub_shard, SHARDS, path)
+    updates = recorded_updates()
+    router = replay(queues, workers, updates)
+
+    expected_history = {}
+    expected_approved = set()
+    for data in updates:
+        user_id = data["message"]["from"]["id"]
+        expected_history.setdefault(user_id, []).append(data["update_id"])
+        if data["message"]["text"] == "/approve":
+            expected_approved.add(user_id)
+
+    assert dict(StoredDict(store, f"{TENANT}:history")) == expected_history
+    assert set(StoredSet(store, f"{TENANT}:approved_users")) == expected_approved
+    assert dict(StoredDict(store, f"{TENANT}:shard_by_user")) == {user_id: user_id % SHARDS for user_id in USERS}
+    assert not set(StoredSet(store, f"{TENANT}:misrouted"))
+    assert sum(router.routed) == len(updates)
+
+
+def test_users_of_one_shard_spread_over_all_lanes(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    store = SharedStore(path)
+
+    queues, workers = start_workers(run_lane_shard, LANE_SHARDS, path)
+    replay(queues, workers, recorded_updates(LANE_USERS, steps=2))
+
+    for shard in range(LANE_SHARDS):
+        lane_by_user = dict(StoredDict(store, f"{TENANT}:lane_by_user:{shard}"))
+        assert set(lane_by_user) == {user_id for user_id in LANE_USERS if user_id % LANE_SHARDS == shard}
+        assert len(set(lane_by_user.values())) == LANES